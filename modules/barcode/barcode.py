@@ -6,16 +6,29 @@ from qreader import QReader
 from pylibdmtx.pylibdmtx import decode as zxing_decode
 from ultralytics import YOLO
 
-# Load YOLO model
-model = YOLO('../weights/best.pt')
+# YOLO model is loaded on first use instead of in every importing process
+YOLO_WEIGHTS = '../weights/best.pt'
+model = None
+
+def load_yolo_model(weights=YOLO_WEIGHTS):
+    global model
+    if model is None:
+        model = YOLO(weights)
+    return model
 
 # Define class names for YOLO
 classNames = ["Item", "QR_code", "Bar_code"]
 
-# Initialize QR Code Detectors
-qreader = QReader()
+# Initialize QR Code Detectors (QReader loads its detector weights on first use)
+qreader = None
 cv_qr_detector = cv2.QRCodeDetector()
 
+def load_qreader():
+    global qreader
+    if qreader is None:
+        qreader = QReader()
+    return qreader
+
 def compute_tight_bbox(x1, y1, x2, y2, image_shape):
     h, w, _ = image_shape
     x1, y1 = max(0, x1), max(0, y1)
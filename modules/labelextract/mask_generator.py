@@ -6,4 +6,9 @@ def generate_mask(model, image_path):
     image = cv2.imread(image_path)
     image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     mask_generator = SamAutomaticMaskGenerator(model)
-    return mask_generator.generate(image_rgb), image_rgb
\ No newline at end of file
+    return mask_generator.generate(image_rgb), image_rgb
+
+def generate_mask_remote(model_client, image_path):
+    image = cv2.imread(image_path)
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return model_client.infer("sam", image_rgb), image_rgb
\ No newline at end of file
@@ -0,0 +1,245 @@
+import os
+import sys
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# Sibling modules hold the model loaders
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "labelextract")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ocr")))
+
+# How often blocked callers wake up to check that the other side is still alive
+POLL_INTERVAL = 1.0
+
+
+def _load_sam(config):
+    from model import load_model
+    from segment_anything import SamAutomaticMaskGenerator
+    sam, _ = load_model(config["sam_checkpoint"])
+    return SamAutomaticMaskGenerator(sam)
+
+
+def _load_ocr(config):
+    from ocr import load_ocr_engine
+    return load_ocr_engine()
+
+
+def _run_sam(mask_generator, image):
+    masks = mask_generator.generate(image)
+    # Full-resolution segmentations are not needed by the pipeline and
+    # would have to be pickled back to the worker, so only metadata is kept
+    return [{k: v for k, v in m.items() if k != "segmentation"} for m in masks]
+
+
+def _run_ocr(engine, image):
+    return engine.ocr(image, cls=True)
+
+
+# Neither SamAutomaticMaskGenerator nor PaddleOCR takes a batch of images in
+# one call, so requests are served one at a time in arrival order
+_ENGINES = {
+    "sam": {"load": _load_sam, "run": _run_sam},
+    "ocr": {"load": _load_ocr, "run": _run_ocr},
+}
+ENGINES = tuple(_ENGINES)
+
+
+def _attach(name):
+    # Blocks are created and unlinked by the ModelServer in the parent. Server
+    # and workers share the parent's resource tracker, so on Python < 3.13 the
+    # registration made by attaching is a duplicate of the parent's entry and
+    # is cleared by the parent's unlink; unregistering here would drop it early.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _request_image(request, blocks):
+    client_id, _, payload = request
+    if isinstance(payload, np.ndarray):
+        return payload
+    shape, dtype = payload
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[client_id].buf)
+
+
+def _handle_request(request, models, blocks, responses):
+    client_id, engine, _ = request
+    image = None
+    try:
+        image = _request_image(request, blocks)
+        responses[client_id].put(("ok", _ENGINES[engine]["run"](models[engine], image)))
+    except Exception as e:
+        responses[client_id].put(("error", str(e)))
+    finally:
+        # The view into the block must be gone before the block can be closed
+        del image
+
+
+def _serve(engines, config, block_names, requests, responses, status):
+    models, load_errors = {}, {}
+    for engine in engines:
+        print(f"Model server: loading {engine}...")
+        try:
+            models[engine] = _ENGINES[engine]["load"](config)
+        except Exception as e:
+            load_errors[engine] = str(e)
+
+    status.put(load_errors)
+    if load_errors:
+        return
+
+    blocks = [_attach(name) for name in block_names]
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            _handle_request(request, models, blocks, responses)
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class ModelClient:
+    """
+    Worker-side handle for a ModelServer. Each worker process must use its own
+    client, and a client only has one request in flight at a time.
+    """
+
+    def __init__(self, client_id, requests, responses, block_name, stopped):
+        self.client_id = client_id
+        self._requests = requests
+        self._responses = responses
+        self._block_name = block_name
+        self._stopped = stopped
+        self._block = None
+
+    def infer(self, engine, image):
+        """
+        Runs `engine` on `image` in the server process. The pixels are copied
+        into this client's shared memory block instead of being pickled onto
+        the queue. Images larger than the block are pickled, with a warning.
+
+        Parameters:
+            engine (str): One of ENGINES.
+            image (np.ndarray): Image in the layout the engine expects
+                (RGB for sam, BGR for ocr).
+
+        Returns:
+            The engine output for this image.
+        """
+        if engine not in _ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'")
+        if self._block is None:
+            self._block = _attach(self._block_name)
+
+        image = np.ascontiguousarray(image)
+        if image.nbytes <= self._block.size:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=self._block.buf)[:] = image
+            payload = (image.shape, image.dtype.str)
+        else:
+            print(f"Model server: {image.nbytes / 2**20:.1f} MB image exceeds the "
+                  f"{self._block.size / 2**20:.0f} MB shared memory block, sending it pickled")
+            payload = image
+        self._requests.put((self.client_id, engine, payload))
+
+        while True:
+            try:
+                status, result = self._responses.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                if self._stopped.is_set():
+                    raise RuntimeError("Model server is not running")
+
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def close(self):
+        if self._block is not None:
+            self._block.close()
+            self._block = None
+
+
+class ModelServer:
+    """
+    Loads each requested engine once in a dedicated process and serves
+    inference for many worker processes. Requests are served one at a time
+    in arrival order, since neither engine can run a batch in one call.
+
+    Every client gets its own reusable shared memory block of `block_mb`
+    megabytes, so /dev/shm must hold num_clients * block_mb. Clients have to
+    be handed to the worker processes when they are created, so all of them
+    are allocated up front.
+    """
+
+    def __init__(self, engines, num_clients, block_mb, sam_checkpoint=None):
+        unknown = [e for e in engines if e not in _ENGINES]
+        if unknown:
+            raise ValueError(f"Unknown engines: {', '.join(unknown)}")
+        if "sam" in engines and not sam_checkpoint:
+            raise ValueError("sam_checkpoint is required to serve sam")
+
+        self.engines = list(engines)
+        self.config = {"sam_checkpoint": sam_checkpoint}
+
+        # The server process is spawned rather than forked, since the parent
+        # has usually imported torch by now and CUDA does not survive a fork
+        self._ctx = mp.get_context("spawn")
+        self._requests = self._ctx.Queue()
+        self._responses = [self._ctx.Queue() for _ in range(num_clients)]
+        self._status = self._ctx.Queue()
+        self._stopped = self._ctx.Event()
+        self._blocks = [shared_memory.SharedMemory(create=True, size=block_mb * 1024 * 1024)
+                        for _ in range(num_clients)]
+        self.clients = [ModelClient(i, self._requests, q, block.name, self._stopped)
+                        for i, (q, block) in enumerate(zip(self._responses, self._blocks))]
+        self._process = None
+
+    def start(self):
+        """Starts the server and blocks until every engine has loaded."""
+        self._process = self._ctx.Process(
+            target=_serve,
+            args=(self.engines, self.config, [block.name for block in self._blocks],
+                  self._requests, self._responses, self._status),
+            daemon=True,
+        )
+        self._process.start()
+
+        while True:
+            try:
+                load_errors = self._status.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    exitcode = self._process.exitcode
+                    self.stop()
+                    raise RuntimeError(f"Model server exited with code {exitcode} while loading")
+
+        if load_errors:
+            self.stop()
+            details = "; ".join(f"{engine}: {error}" for engine, error in load_errors.items())
+            raise RuntimeError(f"Model server failed to load {details}")
+
+    def check(self):
+        """Raises if the server process has died."""
+        if self._process is not None and not self._process.is_alive():
+            self._stopped.set()
+            raise RuntimeError(f"Model server exited unexpectedly with code {self._process.exitcode}")
+
+    def stop(self, timeout=30):
+        self._stopped.set()
+        if self._process is not None:
+            if self._process.is_alive():
+                self._requests.put(None)
+                self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
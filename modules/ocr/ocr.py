@@ -8,13 +8,20 @@ from pillow_heif import register_heif_opener
 # Register HEIC support
 register_heif_opener()
 
-# Initialize OCR engine
-ocr = PaddleOCR(use_angle_cls=True, lang='en',
-                det_db_thresh=0.3, det_db_box_thresh=0.5,
-                det_db_unclip_ratio=2.0,
-                show_log=False)
+# OCR engine is created on first use, so processes that send OCR requests
+# to the model server never load the PaddleOCR weights
+ocr = None
 
-def run_ocr_on_image(image_path, save_dir):
+def load_ocr_engine():
+    global ocr
+    if ocr is None:
+        ocr = PaddleOCR(use_angle_cls=True, lang='en',
+                        det_db_thresh=0.3, det_db_box_thresh=0.5,
+                        det_db_unclip_ratio=2.0,
+                        show_log=False)
+    return ocr
+
+def run_ocr_on_image(image_path, save_dir, model_client=None):
     try:
         # Step 1: Convert HEIC to JPG if needed
         ext = os.path.splitext(image_path)[1].lower()
@@ -31,12 +38,11 @@ def run_ocr_on_image(image_path, save_dir):
         kernel_sharpening = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
         sharpened = cv2.filter2D(contrast, -1, kernel_sharpening)
 
-        sharpened_path = os.path.join(save_dir, "temp_sharpened.jpg")
-        cv2.imwrite(sharpened_path, sharpened)
-
-        # Step 3: OCR
-        result = ocr.ocr(sharpened_path, cls=True)
-        os.remove(sharpened_path)
+        # Step 3: OCR (both paths see the same in-memory pixels)
+        if model_client is not None:
+            result = model_client.infer("ocr", sharpened)
+        else:
+            result = load_ocr_engine().ocr(sharpened, cls=True)
 
         if not result or not result[0]:
             print(f"No text detected in {image_path}")
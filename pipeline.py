@@ -4,6 +4,8 @@ import argparse
 from datetime import datetime
 import shutil
 import glob
+import queue
+import multiprocessing as mp
 import cv2
 import pydicom
 from pydicom.uid import ExplicitVRLittleEndian
@@ -14,32 +16,39 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "modules", "barcode")))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "modules", "ocr")))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "modules", "labelextract")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "modules", "modelserver")))
 
 # Imports
 from svs_to_jpeg import convert_svs_bottom_layer_to_jpeg, jpeg_to_svs
 from barcode import process_image as run_barcode
 from ocr import run_ocr_on_image
 from model import load_model
-from mask_generator import generate_mask
+from mask_generator import generate_mask, generate_mask_remote
 from utils import find_label_area_from_generated_mask
+from model_server import ModelServer, POLL_INTERVAL
 
 # CLI args
 parser = argparse.ArgumentParser(description="Pathology Slide Processor")
 parser.add_argument("--input", required=True, help="Folder with .dcm/.svs/.jpg input images")
 parser.add_argument("--output", required=True, help="Folder to save processed results")
 parser.add_argument("--modules", required=True, help="Comma-separated modules: ocr,barcode,label")
+parser.add_argument("--workers", type=int, default=1,
+                    help="Worker processes; above 1, models are loaded once in a shared model server")
+parser.add_argument("--shm-block-mb", type=int, default=64,
+                    help="Shared memory per worker for images sent to the model server; "
+                         "/dev/shm must hold workers * this. Larger images are pickled")
 args = parser.parse_args()
 
 INPUT_FOLDER = args.input
 OUTPUT_FOLDER = args.output
 ENABLED_MODULES = [m.strip().lower() for m in args.modules.split(",")]
+NUM_WORKERS = max(1, args.workers)
 
 # Logging
 LOG_FOLDER = "log/"
 os.makedirs(LOG_FOLDER, exist_ok=True)
 LOG_FILE = os.path.join(LOG_FOLDER, "log.txt")
 OVERWRITE_FILE = os.path.join(LOG_FOLDER, "overwrite_counts.txt")
-open(LOG_FILE, "w").close()
 
 overwrite_count = {}
 if os.path.exists(OVERWRITE_FILE) and os.stat(OVERWRITE_FILE).st_size > 0:
@@ -54,12 +63,12 @@ if os.path.exists(OVERWRITE_FILE) and os.stat(OVERWRITE_FILE).st_size > 0:
                 except:
                     continue
 
-# Load SAM model if needed
+# Load SAM model if needed (with several workers the model server loads it instead)
+SAM_CHECKPOINT = os.path.join("modules", "labelextract", "sam_vit_h_4b8939.pth")
 sam, device = None, None
-if "label" in ENABLED_MODULES:
+if "label" in ENABLED_MODULES and NUM_WORKERS == 1:
     print("Loading SAM model for label removal...")
-    checkpoint = os.path.join("modules", "labelextract", "sam_vit_h_4b8939.pth")
-    sam, device = load_model(checkpoint)
+    sam, device = load_model(SAM_CHECKPOINT)
 
 def convert_dicom_bottom_layer_to_jpeg(input_dicom_path, output_jpeg_path=None):
     """Convert DICOM to JPEG and return both pixel array and original DICOM data"""
@@ -128,7 +137,7 @@ def clean_jpeg_files(folder):
             print(f"Error removing {jpeg_file}: {e}")
     return removed_count
 
-def process_file(image_path, rel_path, output_dir):
+def process_file(image_path, rel_path, output_dir, model_client=None):
     """Process an image file through enabled modules"""
     file_name = os.path.basename(image_path)
     edited_name = f"edited_{file_name}"
@@ -141,28 +150,167 @@ def process_file(image_path, rel_path, output_dir):
             print("Barcode removal...")
             out_path = run_barcode(out_path, os.path.dirname(out_path))
         
-        if "label" in ENABLED_MODULES and sam:
+        if "label" in ENABLED_MODULES and (sam or model_client):
             print("Label removal...")
-            mask, image_rgb = generate_mask(sam, out_path)
+            if model_client is not None:
+                mask, image_rgb = generate_mask_remote(model_client, out_path)
+            else:
+                mask, image_rgb = generate_mask(sam, out_path)
             shape = (image_rgb.shape[0], image_rgb.shape[1])
             find_label_area_from_generated_mask(mask, shape, image_rgb, out_path)
         
         if "ocr" in ENABLED_MODULES:
             print("OCR...")
-            run_ocr_on_image(out_path, os.path.dirname(out_path))
+            run_ocr_on_image(out_path, os.path.dirname(out_path), model_client)
             
         return out_path
     except Exception as e:
         print(f"Error processing {out_path}: {e}")
         return None
 
+def process_input(full_path, rel_path, output_subdir, model_client=None):
+    """
+    Process one input file of any supported type and write it to output_subdir.
+    Returns the number of files produced and the temporary files to clean up.
+    """
+    file = os.path.basename(full_path)
+    file_lower = file.lower()
+    file_base = os.path.splitext(file)[0]
+    image_count = 0
+    temp_files = set()
+
+    try:
+        if file_lower.endswith(".dcm"):
+            # DICOM processing pipeline
+            temp_jpeg = os.path.join(output_subdir, f"{file_base}_temp.jpg")
+            final_output = os.path.join(output_subdir, file)
+
+            # Convert DICOM to JPEG
+            pixel_array, original_ds = convert_dicom_bottom_layer_to_jpeg(full_path, temp_jpeg)
+            temp_files.add(temp_jpeg)
+
+            # Process the JPEG
+            processed_path = process_file(temp_jpeg, rel_path, output_subdir, model_client)
+            if processed_path and os.path.exists(processed_path):
+                temp_files.add(processed_path)
+                # Read the processed image
+                modified_img = cv2.imread(processed_path, cv2.IMREAD_GRAYSCALE)
+
+                # Convert back to DICOM using the MODIFIED image
+                convert_jpeg_to_dicom(modified_img, final_output, original_ds)
+                image_count += 1
+
+        elif file_lower.endswith(".svs"):
+            # SVS processing pipeline
+            temp_jpeg = os.path.join(output_subdir, f"{file_base}_temp.jpg")
+            final_output = os.path.join(output_subdir, file)
+
+            convert_svs_bottom_layer_to_jpeg(full_path, temp_jpeg)
+            temp_files.add(temp_jpeg)
+
+            processed_path = process_file(temp_jpeg, rel_path, output_subdir, model_client)
+            if processed_path and os.path.exists(processed_path):
+                temp_files.add(processed_path)
+                jpeg_to_svs(processed_path, final_output)
+                image_count += 1
+
+        elif file_lower.endswith((".jpg", ".jpeg", ".png")):
+            # Regular image processing
+            processed_path = process_file(full_path, rel_path, output_subdir, model_client)
+            if processed_path:
+                final_output = os.path.join(output_subdir, file)
+                shutil.move(processed_path, final_output)
+                image_count += 1
+
+    except Exception as e:
+        print(f"Failed to process {file}: {e}")
+
+    return image_count, temp_files
+
+def worker_loop(jobs, results, model_client):
+    """Process jobs from the queue until the None sentinel is received"""
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            results.put(process_input(*job, model_client=model_client))
+    finally:
+        if model_client is not None:
+            model_client.close()
+
+def run_parallel(jobs):
+    """Process jobs in NUM_WORKERS processes that share one model server"""
+    engines = []
+    if "label" in ENABLED_MODULES:
+        engines.append("sam")
+    if "ocr" in ENABLED_MODULES:
+        engines.append("ocr")
+
+    # Workers are spawned like the model server: the parent has imported torch,
+    # and spawn behaves the same on every platform. Weights are only loaded on
+    # first use, so re-importing this module in each worker stays cheap.
+    ctx = mp.get_context("spawn")
+
+    server = None
+    clients = [None] * NUM_WORKERS
+    if engines:
+        server = ModelServer(engines, NUM_WORKERS, args.shm_block_mb, sam_checkpoint=SAM_CHECKPOINT)
+        clients = server.clients
+
+    workers = []
+    try:
+        # Fails before any file is touched if an engine did not load, so no
+        # output is ever written with a redaction step silently missing
+        if server:
+            server.start()
+
+        job_queue, result_queue = ctx.Queue(), ctx.Queue()
+        for job in jobs:
+            job_queue.put(job)
+        for _ in range(NUM_WORKERS):
+            job_queue.put(None)
+
+        for client in clients:
+            worker = ctx.Process(target=worker_loop, args=(job_queue, result_queue, client), daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        remaining = len(jobs)
+        while remaining:
+            all_exited = all(worker.exitcode is not None for worker in workers)
+            try:
+                result = result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if server:
+                    server.check()
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        raise RuntimeError(f"Worker {worker.pid} exited with code {worker.exitcode}")
+                if all_exited:
+                    raise RuntimeError(f"Workers exited with {remaining} files unprocessed")
+                continue
+            remaining -= 1
+            yield result
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        if server:
+            server.stop()
+
 def run_pipeline():
+    # Truncated here rather than at import, since spawned worker and model
+    # server processes re-import this module
+    open(LOG_FILE, "w").close()
     logs = []
     image_count = 0
     temp_files = set()
 
     print(f"\nScanning '{INPUT_FOLDER}' for DICOM, SVS, and image files...\n")
 
+    jobs = []
     for root, _, files in os.walk(INPUT_FOLDER):
         rel_path = os.path.relpath(root, INPUT_FOLDER)
         output_subdir = os.path.join(OUTPUT_FOLDER, rel_path)
@@ -171,58 +319,17 @@ def run_pipeline():
         for file in files:
             if file.lower() == '.ds_store':
                 continue
-                
-            full_path = os.path.join(root, file)
-            file_lower = file.lower()
-            file_base = os.path.splitext(file)[0]
+            jobs.append((os.path.join(root, file), rel_path, output_subdir))
 
-            try:
-                if file_lower.endswith(".dcm"):
-                    # DICOM processing pipeline
-                    temp_jpeg = os.path.join(output_subdir, f"{file_base}_temp.jpg")
-                    processed_jpeg = os.path.join(output_subdir, f"processed_{file_base}.jpg")
-                    final_output = os.path.join(output_subdir, file)
-                    
-                    # Convert DICOM to JPEG
-                    pixel_array, original_ds = convert_dicom_bottom_layer_to_jpeg(full_path, temp_jpeg)
-                    temp_files.add(temp_jpeg)
-                    
-                    # Process the JPEG
-                    processed_path = process_file(temp_jpeg, rel_path, output_subdir)
-                    if processed_path and os.path.exists(processed_path):
-                        temp_files.add(processed_path)
-                        # Read the processed image
-                        modified_img = cv2.imread(processed_path, cv2.IMREAD_GRAYSCALE)
-                        
-                        # Convert back to DICOM using the MODIFIED image
-                        convert_jpeg_to_dicom(modified_img, final_output, original_ds)
-                        image_count += 1
-                    
-                elif file_lower.endswith(".svs"):
-                    # SVS processing pipeline
-                    temp_jpeg = os.path.join(output_subdir, f"{file_base}_temp.jpg")
-                    processed_jpeg = os.path.join(output_subdir, f"processed_{file_base}.jpg")
-                    final_output = os.path.join(output_subdir, file)
-                    
-                    convert_svs_bottom_layer_to_jpeg(full_path, temp_jpeg)
-                    temp_files.add(temp_jpeg)
-                    
-                    processed_path = process_file(temp_jpeg, rel_path, output_subdir)
-                    if processed_path and os.path.exists(processed_path):
-                        temp_files.add(processed_path)
-                        jpeg_to_svs(processed_path, final_output)
-                        image_count += 1
-                    
-                elif file_lower.endswith((".jpg", ".jpeg", ".png")):
-                    # Regular image processing
-                    processed_path = process_file(full_path, rel_path, output_subdir)
-                    if processed_path:
-                        final_output = os.path.join(output_subdir, file)
-                        shutil.move(processed_path, final_output)
-                        image_count += 1
-                        
-            except Exception as e:
-                print(f"Failed to process {file}: {e}")
+    if NUM_WORKERS > 1:
+        print(f"Processing {len(jobs)} files with {NUM_WORKERS} workers...")
+        results = run_parallel(jobs)
+    else:
+        results = (process_input(*job) for job in jobs)
+
+    for count, files in results:
+        image_count += count
+        temp_files.update(files)
 
     # Cleanup temporary files
     print("\nCleaning up temporary files...")